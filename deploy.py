@@ -6,69 +6,254 @@ Handles deployment to different environments with proper configuration
 
 import os
 import sys
-import subprocess
-import shutil
-from pathlib import Path
+import fnmatch
+import re
+from typing import Callable, Dict
 
-def deploy_to_environment(env: str):
+# asyncio, hashlib, shutil and subprocess are imported inside the
+# functions that use them so that `status` and the help text start fast
+
+ENVIRONMENTS = ("development", "staging", "production")
+VALID_ENVIRONMENTS = frozenset(ENVIRONMENTS)
+
+# Matches the ENVIRONMENT line of a .env file
+_ENV_RE = re.compile(rb"^ENVIRONMENT=(development|staging|production)\b", re.M)
+
+# Deployment artifacts removed by the cleanup command
+CLEANUP_ITEMS = (
+    "student_grades*.db",
+    "student_grades*.db-wal",
+    "student_grades*.db-shm",
+    "alert.log",
+    "costs.csv",
+    "__pycache__",
+    ".pytest_cache",
+    "*.pyc",
+)
+_CLEANUP_NAMES = frozenset(item for item in CLEANUP_ITEMS if "*" not in item)
+_CLEANUP_RE = re.compile("|".join(fnmatch.translate(item) for item in CLEANUP_ITEMS if "*" in item))
+
+# Child processes are launched with an absolute executable path and no
+# close_fds/preexec_fn, which lets CPython use posix_spawn instead of
+# fork+exec on Linux. Descriptors are non-inheritable by default (PEP 446),
+# so nothing extra leaks into the child.
+_SPAWN_KWARGS = {"close_fds": False}
+
+# Environment snapshot taken at startup; child overrides are layered on top
+_BASE_ENV = dict(os.environ)
+
+# Stamp of the last successful install: requirements.txt plus the target interpreter
+DEPLOY_CACHE_DIR = ".deploy_cache"
+REQUIREMENTS_STAMP = os.path.join(DEPLOY_CACHE_DIR, "req.sha256")
+
+# Stamp of the last deploy whose tests passed: environment, .env.<env> and requirements digests
+DEPLOY_STAMP = os.path.join(DEPLOY_CACHE_DIR, "deploy.stamp")
+
+# Deploy progress lines, written to stdout in one call per phase
+_log_buf = []
+
+def _log(message: str):
+    _log_buf.append(message)
+
+def _flush():
+    """Write buffered progress lines with a single stdout write"""
+    if _log_buf:
+        sys.stdout.write("\n".join(_log_buf) + "\n")
+        sys.stdout.flush()
+        _log_buf.clear()
+
+def _requirements_fingerprint() -> str:
+    """SHA-256 hex digest of requirements.txt and the interpreter it is installed into"""
+    import hashlib
+    with open("requirements.txt", "rb") as f:
+        digest = hashlib.file_digest(f, "sha256")
+    # A different or recreated environment must not match an old install
+    digest.update(f"\0{sys.executable}\0{sys.prefix}".encode())
+    return digest.hexdigest()
+
+def _requirements_fingerprint_matches(fingerprint: str) -> bool:
+    """Check whether requirements.txt is unchanged since the last install"""
+    try:
+        with open(REQUIREMENTS_STAMP, "r") as f:
+            return f.read().strip() == fingerprint
+    except OSError:
+        return False
+
+def _write_stamp(path: str, contents: str):
+    """Atomically write a stamp file under DEPLOY_CACHE_DIR"""
+    os.makedirs(DEPLOY_CACHE_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+
+def _write_requirements_stamp(fingerprint: str):
+    """Atomically record the fingerprint of the installed requirements"""
+    _write_stamp(REQUIREMENTS_STAMP, fingerprint)
+
+def _deploy_fingerprint(env: str, env_file: str) -> str:
+    """Environment name plus the digests of its .env file and the requirements"""
+    import hashlib
+    with open(env_file, "rb") as f:
+        env_digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return f"{env} {env_digest} {_requirements_fingerprint()}"
+
+def _deploy_stamp_matches(fingerprint: str) -> bool:
+    """Check whether the last deploy with passing tests had this fingerprint"""
+    try:
+        with open(DEPLOY_STAMP, "r") as f:
+            return f.read().strip() == fingerprint
+    except OSError:
+        return False
+
+def _install_command() -> list:
+    """Prefer uv's resolver when available, fall back to pip"""
+    import shutil
+    uv = shutil.which("uv")
+    if uv:
+        return [uv, "pip", "install", "--python", sys.executable, "-r", "requirements.txt"]
+    # -I: pip needs neither user site-packages nor PYTHON* variables
+    return [sys.executable, "-I", "-m", "pip", "install", "-r", "requirements.txt"]
+
+async def _run_streaming(*cmd, tail_lines: int = 200, echo: bool = False):
+    """Run a command, keeping only the last lines of its combined output (echoed live with echo); returns (returncode, tail)"""
+    import asyncio
+    from collections import deque
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        **_SPAWN_KWARGS
+    )
+    tail = deque(maxlen=tail_lines)
+    try:
+        async for line in proc.stdout:
+            text = line.decode(errors="replace")
+            tail.append(text)
+            if echo:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+        return await proc.wait(), "".join(tail)
+    except BaseException:
+        # Interrupted (e.g. Ctrl-C): stop the child, escalating if it ignores SIGTERM
+        if proc.returncode is None:
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        raise
+
+async def _install_dependencies(verbose: bool = False):
+    """Install requirements.txt unless already installed into this interpreter; returns (returncode, output tail)"""
+    fingerprint = _requirements_fingerprint()
+    if _requirements_fingerprint_matches(fingerprint):
+        _log("Dependencies cached (requirements.txt and interpreter unchanged)")
+        return 0, ""
+    
+    _log("Installing dependencies...")
+    _flush()
+    returncode, output = await _run_streaming(*_install_command(), echo=verbose)
+    
+    if returncode == 0:
+        _write_requirements_stamp(fingerprint)
+        _log("Dependencies installed successfully")
+    return returncode, output
+
+def _activate_env_file(env_file: str):
+    """Atomically replace .env with a copy of env_file (contents only, mode bits are not copied)"""
+    import shutil
+    tmp_path = ".env.tmp"
+    shutil.copyfile(env_file, tmp_path)
+    os.replace(tmp_path, ".env")
+
+def run_tests(isolate: bool = False) -> bool:
+    """Run the pytest suite in-process, or in a fresh interpreter when isolate is set"""
+    if isolate:
+        import subprocess
+        # No -I here: the suite imports main.py from the script directory
+        env = _BASE_ENV | {"PYTHONDONTWRITEBYTECODE": "1"}
+        result = subprocess.run([sys.executable, "-m", "pytest", "unit_test.py"], env=env, **_SPAWN_KWARGS)
+        return result.returncode == 0
+    
+    import pytest
+    return pytest.main(["unit_test.py"]) == 0
+
+async def deploy_to_environment(env: str, isolate: bool = False, force: bool = False, verbose: bool = False):
     """Deploy to specific environment"""
+    import asyncio
     
-    valid_environments = ["development", "staging", "production"]
-    if env not in valid_environments:
+    if env not in VALID_ENVIRONMENTS:
+        _flush()
         print(f"❌ Invalid environment: {env}")
-        print(f"Valid environments: {', '.join(valid_environments)}")
+        print(f"Valid environments: {', '.join(ENVIRONMENTS)}")
         return False
     
-    print(f"Deploying to {env.upper()} environment...")
+    _log(f"Deploying to {env.upper()} environment...")
     
     # Copy environment configuration
     env_file = f".env.{env}"
     if not os.path.exists(env_file):
+        _flush()
         print(f"ERROR: Environment file not found: {env_file}")
         return False
     
-    shutil.copy(env_file, ".env")
-    print(f"Environment configuration copied from {env_file}")
+    # Already in the target state: the last deploy with passing tests used the
+    # same environment, .env.<env> contents and requirements
+    deploy_fingerprint = _deploy_fingerprint(env, env_file)
+    if (not force and os.path.exists(".env")
+            and _deploy_stamp_matches(deploy_fingerprint)):
+        _log(f"✅ Already deployed to {env.upper()} (use --force to redeploy)")
+        _flush()
+        return True
     
-    # Install dependencies
-    print("Installing dependencies...")
-    result = subprocess.run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], 
-                          capture_output=True, text=True)
+    # .env is about to change; the old stamp no longer describes it
+    try:
+        os.unlink(DEPLOY_STAMP)
+    except FileNotFoundError:
+        pass
     
-    if result.returncode != 0:
-        print(f"ERROR: Failed to install dependencies: {result.stderr}")
-        return False
+    # Copy environment configuration and install dependencies concurrently;
+    # neither depends on the other, only the test run needs both
+    _, (pip_returncode, pip_output) = await asyncio.gather(
+        asyncio.to_thread(_activate_env_file, env_file),
+        _install_dependencies(verbose)
+    )
+    _log(f"Environment configuration copied from {env_file}")
+    _flush()
     
-    print("Dependencies installed successfully")
+    if pip_returncode != 0:
+        print(f"ERROR: Failed to install dependencies: {pip_output}")
+        return False
     
     # Run tests
-    print("Running tests...")
-    result = subprocess.run([sys.executable, "unit_test.py"], 
-                          capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print(f"ERROR: Tests failed: {result.stderr}")
+    print("Running tests...", flush=True)
+    # Off the event loop so the suite is free to drive its own
+    if not await asyncio.to_thread(run_tests, isolate):
+        print("ERROR: Tests failed")
         return False
     
-    print("All tests passed")
+    _log("All tests passed")
+    _write_stamp(DEPLOY_STAMP, deploy_fingerprint)
     
     # Start application based on environment
-    print(f"Starting application in {env} mode...")
+    _log(f"Starting application in {env} mode...")
     
     if env == "development":
-        print("Starting development server with auto-reload...")
-        print("Command: python main.py")
-        print("Dashboard: http://localhost:8000/dashboard")
+        _log("Starting development server with auto-reload...")
+        _log("Command: python main.py")
+        _log("Dashboard: http://localhost:8000/dashboard")
         
     elif env == "staging":
-        print("Starting staging server...")
-        print("Command: uvicorn main:app --host 0.0.0.0 --port 8000")
+        _log("Starting staging server...")
+        _log("Command: uvicorn main:app --host 0.0.0.0 --port 8000")
         
     elif env == "production":
-        print("Starting production server with Gunicorn...")
-        print("Command: gunicorn main:app -w 4 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000")
+        _log("Starting production server with Gunicorn...")
+        _log("Command: gunicorn main:app -w 4 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000")
     
-    print(f"\nDeployment to {env.upper()} completed successfully!")
+    _log(f"\nDeployment to {env.upper()} completed successfully!")
+    _flush()
     return True
 
 def show_environment_status():
@@ -76,31 +261,26 @@ def show_environment_status():
     print("Environment Status")
     print("=" * 40)
     
-    # Check which environment files exist
-    environments = ["development", "staging", "production"]
+    # Check which environment files exist (one directory listing)
+    with os.scandir(".") as entries:
+        present = {entry.name for entry in entries}
     
-    for env in environments:
+    for env in ENVIRONMENTS:
         env_file = f".env.{env}"
-        status = "OK" if os.path.exists(env_file) else "MISSING"
+        status = "OK" if env_file in present else "MISSING"
         print(f"{status} {env.capitalize()}: {env_file}")
     
     # Check current .env file
-    if os.path.exists(".env"):
+    if ".env" in present:
         print(f"Current .env file exists")
         
         # Try to determine current environment
         try:
-            with open(".env", "r") as f:
-                content = f.read()
-                if "ENVIRONMENT=development" in content:
-                    print("Current environment: DEVELOPMENT")
-                elif "ENVIRONMENT=staging" in content:
-                    print("Current environment: STAGING")
-                elif "ENVIRONMENT=production" in content:
-                    print("Current environment: PRODUCTION")
-                else:
-                    print("Current environment: UNKNOWN")
-        except:
+            with open(".env", "rb") as f:
+                match = _ENV_RE.search(f.read())
+            label = match.group(1).decode().upper() if match else "UNKNOWN"
+            print(f"Current environment: {label}")
+        except OSError:
             print("ERROR: Could not read .env file")
     else:
         print("ERROR: No .env file found")
@@ -109,97 +289,112 @@ def show_environment_status():
 
 def cleanup_deployment():
     """Clean up deployment artifacts"""
+    import shutil
     print("Cleaning up deployment artifacts...")
     
-    cleanup_items = [
-        "student_grades*.db",
-        "alert.log",
-        "costs.csv",
-        "__pycache__",
-        ".pytest_cache",
-        "*.pyc"
-    ]
-    
-    for item in cleanup_items:
-        if "*" in item:
-            # Handle wildcards
-            import glob
-            for file in glob.glob(item):
-                try:
-                    if os.path.isdir(file):
-                        shutil.rmtree(file)
-                    else:
-                        os.remove(file)
-                    print(f"   Removed: {file}")
-                except:
-                    pass
-        else:
+    # One directory listing for all patterns; DirEntry.is_dir() reuses the
+    # file type returned by readdir instead of issuing another stat
+    with os.scandir(".") as entries:
+        for entry in entries:
+            if entry.name not in _CLEANUP_NAMES and not _CLEANUP_RE.match(entry.name):
+                continue
             try:
-                if os.path.exists(item):
-                    if os.path.isdir(item):
-                        shutil.rmtree(item)
-                    else:
-                        os.remove(item)
-                    print(f"   Removed: {item}")
-            except:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+                print(f"   Removed: {entry.name}")
+            except OSError:
                 pass
     
     print("Cleanup completed")
 
+_USAGE = """\
+Student Grade Analytics API - Deployment Script
+==================================================
+
+Usage:
+  python deploy.py <command> [environment] [--isolate] [--force] [--verbose]
+
+Commands:
+  deploy <env>    - Deploy to environment (development/staging/production)
+  status          - Show environment status
+  cleanup         - Clean up deployment artifacts
+  test            - Run tests only
+
+Options:
+  --isolate       - Run tests in a separate Python interpreter
+  --force         - Redeploy even if already at the target environment
+  --verbose       - Stream dependency installer output as it runs
+
+Examples:
+  python deploy.py deploy development
+  python deploy.py deploy production
+  python deploy.py status
+  python deploy.py cleanup
+"""
+
 def main():
     """Main deployment script"""
     if len(sys.argv) < 2:
-        print("Student Grade Analytics API - Deployment Script")
-        print("=" * 50)
-        print("\nUsage:")
-        print("  python deploy.py <command> [environment]")
-        print("\nCommands:")
-        print("  deploy <env>    - Deploy to environment (development/staging/production)")
-        print("  status          - Show environment status")
-        print("  cleanup         - Clean up deployment artifacts")
-        print("  test            - Run tests only")
-        print("\nExamples:")
-        print("  python deploy.py deploy development")
-        print("  python deploy.py deploy production")
-        print("  python deploy.py status")
-        print("  python deploy.py cleanup")
+        sys.stdout.write(_USAGE)
         return
     
     command = sys.argv[1].lower()
+    handler = COMMANDS.get(command, _unknown_command)
+    sys.exit(handler(sys.argv[2:]))
+
+def _positional(args: list) -> list:
+    """Command arguments with --flags removed"""
+    return [arg for arg in args if not arg.startswith("--")]
+
+def _deploy_command(args: list) -> int:
+    """deploy <env> [--isolate] [--force] [--verbose]"""
+    positional = _positional(args)
+    if not positional:
+        print("ERROR: Environment required for deploy command")
+        print("Usage: python deploy.py deploy <environment>")
+        return 0
     
-    if command == "deploy":
-        if len(sys.argv) < 3:
-            print("ERROR: Environment required for deploy command")
-            print("Usage: python deploy.py deploy <environment>")
-            return
-        
-        environment = sys.argv[2].lower()
-        success = deploy_to_environment(environment)
-        
-        if success:
-            print(f"\nNext Steps:")
-            print(f"1. Visit http://localhost:8000/dashboard for monitoring")
-            print(f"2. Check http://localhost:8000/docs for API documentation")
-            print(f"3. Monitor alert.log for system alerts")
-            print(f"4. Review costs.csv for usage costs")
-        
-        sys.exit(0 if success else 1)
-    
-    elif command == "status":
-        show_environment_status()
-    
-    elif command == "cleanup":
-        cleanup_deployment()
+    import asyncio
+    environment = positional[0].lower()
+    success = asyncio.run(deploy_to_environment(
+        environment, "--isolate" in args, "--force" in args, "--verbose" in args
+    ))
     
-    elif command == "test":
-        print("Running tests...")
-        result = subprocess.run([sys.executable, "unit_test.py"])
-        sys.exit(result.returncode)
+    if success:
+        print(f"\nNext Steps:")
+        print(f"1. Visit http://localhost:8000/dashboard for monitoring")
+        print(f"2. Check http://localhost:8000/docs for API documentation")
+        print(f"3. Monitor alert.log for system alerts")
+        print(f"4. Review costs.csv for usage costs")
     
-    else:
-        print(f"ERROR: Unknown command: {command}")
-        print("Use 'python deploy.py' to see available commands")
-        sys.exit(1)
+    return 0 if success else 1
+
+def _status_command(args: list) -> int:
+    show_environment_status()
+    return 0
+
+def _cleanup_command(args: list) -> int:
+    cleanup_deployment()
+    return 0
+
+def _test_command(args: list) -> int:
+    print("Running tests...")
+    return 0 if run_tests("--isolate" in args) else 1
+
+def _unknown_command(args: list) -> int:
+    print(f"ERROR: Unknown command: {sys.argv[1].lower()}")
+    print("Use 'python deploy.py' to see available commands")
+    return 1
+
+# Command name -> handler taking the remaining argv and returning an exit code
+COMMANDS: Dict[str, Callable[[list], int]] = {
+    "deploy": _deploy_command,
+    "status": _status_command,
+    "cleanup": _cleanup_command,
+    "test": _test_command,
+}
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
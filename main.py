@@ -4,45 +4,66 @@ Demonstrates production setup, performance optimization, monitoring, and cost tr
 """
 
 from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse
-from contextlib import asynccontextmanager
-from pydantic import BaseModel, EmailStr, field_validator
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from contextlib import asynccontextmanager, contextmanager
+from pydantic import BaseModel, EmailStr, TypeAdapter, ValidationError, field_validator
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 import sqlite3
+import asyncio
 import threading
 import time
 import os
 import csv
+import atexit
 import psutil
+import orjson
 import logging
 from collections import OrderedDict, deque
-from statistics import mean, median
+from statistics import mean
 import uvicorn
 from dotenv import load_dotenv
 
 # Load environment configuration
 load_dotenv()
 
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
 # Environment configuration
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 DEBUG = os.getenv("DEBUG", "true").lower() == "true"
 DATABASE_URL = os.getenv("DATABASE_URL", "student_grades.db")
-CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1000"))
+CACHE_SIZE = _env_int("CACHE_SIZE", 1000)
+# CACHE_SIZE is split across CACHE_SHARDS independently locked shards, and each
+# shard evicts on its own, so a busy shard can evict before the cache is full
+CACHE_SHARDS = _env_int("CACHE_SHARDS", 16)
+# Lookups of unknown student IDs are remembered in a separate small cache, so
+# they never push real students out of the CACHE_SIZE entries
+NEGATIVE_CACHE_SIZE = _env_int("NEGATIVE_CACHE_SIZE", 256)
+NEGATIVE_CACHE_TTL = _env_float("NEGATIVE_CACHE_TTL", 30)
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 # Performance settings
-BATCH_SIZE = int(os.getenv("BATCH_SIZE", "100"))
-QUERY_TIMEOUT = int(os.getenv("QUERY_TIMEOUT", "30"))
+BATCH_SIZE = _env_int("BATCH_SIZE", 100)
+QUERY_TIMEOUT = _env_int("QUERY_TIMEOUT", 30)
+BATCH_REINDEX_THRESHOLD = _env_int("BATCH_REINDEX_THRESHOLD", 10000)
 
 # Monitoring settings
-ALERT_RESPONSE_TIME_MS = int(os.getenv("ALERT_RESPONSE_TIME_MS", "300"))
-ALERT_CACHE_HIT_RATE = float(os.getenv("ALERT_CACHE_HIT_RATE", "0.70"))
-ALERT_MEMORY_MB = int(os.getenv("ALERT_MEMORY_MB", "500"))
+ALERT_RESPONSE_TIME_MS = _env_int("ALERT_RESPONSE_TIME_MS", 300)
+ALERT_CACHE_HIT_RATE = _env_float("ALERT_CACHE_HIT_RATE", 0.70)
+ALERT_MEMORY_MB = _env_int("ALERT_MEMORY_MB", 500)
+ALERT_CHECK_INTERVAL = _env_float("ALERT_CHECK_INTERVAL", 5)
 
 # Cost tracking settings
-COST_PER_DB_QUERY = float(os.getenv("COST_PER_DB_QUERY", "0.0001"))
-COST_PER_100_API_CALLS = float(os.getenv("COST_PER_100_API_CALLS", "0.001"))
+COST_PER_DB_QUERY = _env_float("COST_PER_DB_QUERY", 0.0001)
+COST_PER_100_API_CALLS = _env_float("COST_PER_100_API_CALLS", 0.001)
+COSTS_CSV_FILE = os.getenv("COSTS_CSV_PATH", "costs.csv")
+ALERT_LOG_FILE = os.getenv("ALERT_LOG_PATH", "alert.log")
 
 # Configure logging
 logging.basicConfig(
@@ -55,9 +76,12 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     init_database()
+    alert_task = asyncio.create_task(alert_monitor())
     logger.info("Student Grade Analytics API started")
     yield
     # Shutdown
+    alert_task.cancel()
+    db_pool.close_all()
     logger.info("Student Grade Analytics API shutting down")
 
 app = FastAPI(
@@ -65,87 +89,208 @@ app = FastAPI(
     description="Production-ready grade analytics with monitoring, caching, and cost tracking",
     version="1.0.0",
     debug=DEBUG,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # Global metrics and monitoring
+class PerThreadCounter:
+    """Lock-free counter: each thread adds only to its own slot and readers sum the slots"""
+    def __init__(self):
+        self._slots = {}
+    
+    def add(self, n: int = 1):
+        # Only the owning thread writes its slot, so this read-modify-write
+        # cannot race; adding a new key is a single atomic dict operation
+        slots = self._slots
+        thread_id = threading.get_ident()
+        slots[thread_id] = slots.get(thread_id, 0) + n
+    
+    @property
+    def value(self) -> int:
+        return sum(self._slots.copy().values())  # dict.copy() is atomic
+    
+    def reset(self):
+        # Swaps in an empty dict; an increment racing with the swap may be lost
+        self._slots = {}
+
 class SystemMetrics:
     def __init__(self):
-        self.request_count = 0
-        self.db_query_count = 0
-        self.cache_hits = 0
-        self.cache_misses = 0
-        self.response_times = deque(maxlen=100)  # Keep last 100 response times
+        self.response_times = deque(maxlen=100)  # Last 100 response times, in ns
+        self.request_timestamps = deque(maxlen=4096)  # monotonic_ns of recent requests
         self.hourly_costs = []
         self.last_cost_reset = datetime.now()
-        self.lock = threading.RLock()
-    
-    def record_request(self, response_time_ms: float):
-        with self.lock:
-            self.request_count += 1
-            self.response_times.append(response_time_ms)
+        # The record_* methods run on every request and take no lock
+        self._requests = PerThreadCounter()
+        self._db_queries = PerThreadCounter()
+        self._cache_hits = PerThreadCounter()
+        self._cache_misses = PerThreadCounter()
+    
+    def reset(self):
+        """Zero all counters and clear recorded response times"""
+        self._requests.reset()
+        self._db_queries.reset()
+        self._cache_hits.reset()
+        self._cache_misses.reset()
+        self.response_times.clear()
+        self.request_timestamps.clear()
+    
+    # Counters are read-only; they change only through the record_* methods
+    @property
+    def request_count(self) -> int:
+        return self._requests.value
+    
+    @property
+    def db_query_count(self) -> int:
+        return self._db_queries.value
+    
+    @property
+    def cache_hits(self) -> int:
+        return self._cache_hits.value
+    
+    @property
+    def cache_misses(self) -> int:
+        return self._cache_misses.value
+    
+    def record_request(self, response_time_ns: int):
+        self._requests.add()
+        self.response_times.append(response_time_ns)
+        self.request_timestamps.append(time.monotonic_ns())
+    
+    def record_requests(self, response_times_ns):
+        """Record several completed requests at once"""
+        times = list(response_times_ns)
+        if not times:
+            return
+        self._requests.add(len(times))
+        self.response_times.extend(times)
+        self.request_timestamps.extend([time.monotonic_ns()] * len(times))
     
     def record_db_query(self):
-        with self.lock:
-            self.db_query_count += 1
+        self._db_queries.add()
     
     def record_cache_hit(self):
-        with self.lock:
-            self.cache_hits += 1
+        self._cache_hits.add()
     
     def record_cache_miss(self):
-        with self.lock:
-            self.cache_misses += 1
+        self._cache_misses.add()
     
     def get_cache_hit_rate(self) -> float:
-        with self.lock:
-            total = self.cache_hits + self.cache_misses
-            return (self.cache_hits / total) if total > 0 else 0.0
+        hits, misses = self.cache_hits, self.cache_misses
+        total = hits + misses
+        return (hits / total) if total > 0 else 0.0
     
     def get_avg_response_time(self) -> float:
-        with self.lock:
-            return mean(self.response_times) if self.response_times else 0.0
+        times = list(self.response_times)  # Snapshot; deque copy is atomic
+        return mean(times) / 1_000_000 if times else 0.0  # ms
     
     def get_requests_per_minute(self) -> float:
-        with self.lock:
-            # Simple approximation based on recent activity
-            return len(self.response_times)  # Rough estimate
+        # Drop timestamps older than a minute; what remains is the last minute's requests
+        cutoff = time.monotonic_ns() - 60_000_000_000
+        timestamps = self.request_timestamps
+        try:
+            while timestamps[0] < cutoff:
+                timestamps.popleft()
+        except IndexError:
+            pass
+        return len(timestamps)
 
 metrics = SystemMetrics()
 
 # LRU Cache Implementation
 class LRUCache:
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, record_metrics: bool = True):
         self.capacity = capacity
+        self.record_metrics = record_metrics
         self.cache = OrderedDict()
-        self.lock = threading.RLock()
+        self.lock = threading.Lock()
     
     def get(self, key: str) -> Optional[Any]:
         with self.lock:
-            if key in self.cache:
-                # Move to end (most recently used)
-                value = self.cache.pop(key)
-                self.cache[key] = value
-                metrics.record_cache_hit()
-                return value
-            metrics.record_cache_miss()
+            entry = self.cache.get(key)
+            if entry is not None:
+                expires_ns, value = entry
+                if expires_ns is None or time.monotonic_ns() < expires_ns:
+                    # Move to end (most recently used)
+                    self.cache.move_to_end(key)
+                    if self.record_metrics:
+                        metrics.record_cache_hit()
+                    return value
+                del self.cache[key]
+            if self.record_metrics:
+                metrics.record_cache_miss()
             return None
     
-    def put(self, key: str, value: Any):
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store value; entries with a ttl (seconds) expire after that long"""
+        expires_ns = time.monotonic_ns() + int(ttl * 1_000_000_000) if ttl is not None else None
         with self.lock:
             if key in self.cache:
                 self.cache.pop(key)
             elif len(self.cache) >= self.capacity:
                 # Remove least recently used
                 self.cache.popitem(last=False)
-            self.cache[key] = value
+            self.cache[key] = (expires_ns, value)
+    
+    def put_many(self, items):
+        """Store several (key, value) pairs with one bulk update, evicting once at the end"""
+        entries = {key: (None, value) for key, value in items}
+        with self.lock:
+            # Drop existing keys first so update() appends them as most recent
+            for key in entries.keys() & self.cache.keys():
+                del self.cache[key]
+            self.cache.update(entries)
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+    
+    def delete(self, key: str):
+        with self.lock:
+            self.cache.pop(key, None)
     
     def size(self) -> int:
         with self.lock:
             return len(self.cache)
 
+class ShardedLRUCache:
+    """LRU cache split into independently locked shards to reduce contention"""
+    
+    def __init__(self, capacity: int, shards: int = 16):
+        self.capacity = capacity
+        shards = max(1, min(shards, capacity))
+        # Spread the remainder so shard capacities add up to the configured total
+        base, extra = divmod(capacity, shards)
+        self.shards = [LRUCache(base + (i < extra)) for i in range(shards)]
+    
+    def _shard(self, key: str) -> LRUCache:
+        return self.shards[hash(key) % len(self.shards)]
+    
+    def get(self, key: str) -> Optional[Any]:
+        return self._shard(key).get(key)
+    
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._shard(key).put(key, value, ttl)
+    
+    def put_many(self, items):
+        # Group by shard so each shard takes its lock once
+        by_shard = [[] for _ in self.shards]
+        for key, value in items:
+            by_shard[hash(key) % len(self.shards)].append((key, value))
+        for shard, shard_items in zip(self.shards, by_shard):
+            if shard_items:
+                shard.put_many(shard_items)
+    
+    def delete(self, key: str):
+        self._shard(key).delete(key)
+    
+    def size(self) -> int:
+        return sum(shard.size() for shard in self.shards)
+
 # Global cache instance
-student_cache = LRUCache(CACHE_SIZE)
+student_cache = ShardedLRUCache(CACHE_SIZE, CACHE_SHARDS)
+
+# Student IDs recently looked up and not found (expire after NEGATIVE_CACHE_TTL);
+# checked on every lookup, so kept out of the hit-rate metrics
+missing_students = LRUCache(NEGATIVE_CACHE_SIZE, record_metrics=False)
 
 # Pydantic models
 class Student(BaseModel):
@@ -176,6 +321,8 @@ class Grade(BaseModel):
             raise ValueError(f'Score must be between 0 and {max_score}')
         return v
 
+GradeListAdapter = TypeAdapter(List[Grade])
+
 class StudentAnalytics(BaseModel):
     student_id: str
     student_name: str
@@ -185,10 +332,70 @@ class StudentAnalytics(BaseModel):
     lowest_score: float
     subjects: List[str]
 
+# Persistent SQLite connections
+class ConnectionPool:
+    """One long-lived, tuned SQLite connection per thread"""
+    
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-65536",      # 64MB page cache
+        "PRAGMA mmap_size=268435456",    # 256MB memory-mapped I/O
+    )
+    
+    def __init__(self, database: str):
+        self.database = database
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+    
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode; writes use explicit transactions. "file:" URIs
+            # allow e.g. a shared-cache in-memory database for tests
+            conn = sqlite3.connect(self.database, check_same_thread=False,
+                                   timeout=QUERY_TIMEOUT, isolation_level=None,
+                                   uri=self.database.startswith("file:"))
+            conn.row_factory = sqlite3.Row
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+    
+    def close_all(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+db_pool = ConnectionPool(DATABASE_URL)
+
+# Optimized indexes
+STUDENT_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_students_id ON students(student_id)",
+    "CREATE INDEX IF NOT EXISTS idx_students_email ON students(email)",
+    "CREATE INDEX IF NOT EXISTS idx_students_name ON students(name, student_id)",
+)
+GRADE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_grades_student ON grades(student_id)",
+    "CREATE INDEX IF NOT EXISTS idx_grades_subject ON grades(subject)",
+    "CREATE INDEX IF NOT EXISTS idx_grades_date ON grades(date_recorded)",
+    "CREATE INDEX IF NOT EXISTS idx_grades_student_subject ON grades(student_id, subject)",
+    "CREATE INDEX IF NOT EXISTS idx_grades_subject_score ON grades(subject, score)",
+)
+GRADE_INDEX_NAMES = ("idx_grades_student", "idx_grades_subject", "idx_grades_date",
+                     "idx_grades_student_subject", "idx_grades_subject_score")
+
 # Database initialization
 def init_database():
     """Initialize SQLite database with optimized schema"""
-    conn = sqlite3.connect(DATABASE_URL, check_same_thread=False)
+    conn = db_pool.connection()
+    conn.execute("BEGIN IMMEDIATE")
     cursor = conn.cursor()
     
     # Students table
@@ -216,14 +423,6 @@ def init_database():
         )
     """)
     
-    # Create optimized indexes
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_id ON students(student_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_email ON students(email)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_student ON grades(student_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_subject ON grades(subject)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_date ON grades(date_recorded)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_student_subject ON grades(student_id, subject)")
-    
     # Add sample data if empty
     cursor.execute("SELECT COUNT(*) FROM students")
     if cursor.fetchone()[0] == 0:
@@ -255,14 +454,110 @@ def init_database():
         
         logger.info("Sample data added to database")
     
-    conn.commit()
-    conn.close()
+    # Create optimized indexes after the sample load so rows are indexed once
+    for statement in STUDENT_INDEXES + GRADE_INDEXES:
+        cursor.execute(statement)
+    
+    conn.execute("COMMIT")
     logger.info("Database initialized successfully")
 
 def get_db_connection():
-    """Get database connection with query tracking"""
+    """Get this thread's persistent database connection with query tracking"""
     metrics.record_db_query()
-    return sqlite3.connect(DATABASE_URL, check_same_thread=False, timeout=QUERY_TIMEOUT)
+    return db_pool.connection()
+
+STMT_GET_STUDENTS = """
+    SELECT student_id, name, email, grade_level, created_at
+    FROM students
+    ORDER BY name, student_id
+    LIMIT ?
+"""
+STMT_GET_STUDENTS_AFTER = """
+    SELECT student_id, name, email, grade_level, created_at
+    FROM students
+    WHERE (name, student_id) > (?, ?)
+    ORDER BY name, student_id
+    LIMIT ?
+"""
+
+INSERT_GRADE_SQL = """
+    INSERT INTO grades (student_id, subject, score, max_score, date_recorded)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+INSERT_GRADE_IF_STUDENT_SQL = """
+    INSERT INTO grades (student_id, subject, score, max_score, date_recorded)
+    SELECT ?, ?, ?, ?, ?
+    WHERE EXISTS (SELECT 1 FROM students WHERE student_id = ?)
+"""
+
+INSERT_GRADE_DEFAULT_DATE_SQL = """
+    INSERT INTO grades (student_id, subject, score, max_score)
+    VALUES (?, ?, ?, ?)
+"""
+
+INSERT_GRADE_DEFAULT_DATE_IF_STUDENT_SQL = """
+    INSERT INTO grades (student_id, subject, score, max_score)
+    SELECT ?, ?, ?, ?
+    WHERE EXISTS (SELECT 1 FROM students WHERE student_id = ?)
+"""
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Explicit write transaction on an autocommit connection"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+# Append-only output files
+class AppendFile:
+    """Lazily opened, buffered append handle kept open across writes"""
+    
+    def __init__(self, path: str, header: Optional[List[str]] = None):
+        self.path = path
+        self.header = header
+        self.file = None
+        self.writer = None
+        self.lock = threading.Lock()
+    
+    def _handle(self):
+        # Reopen if the file was deleted or rotated underneath us
+        if self.file is not None and os.fstat(self.file.fileno()).st_nlink == 0:
+            self.file.close()
+            self.file = None
+        if self.file is None:
+            self.file = open(self.path, "a", buffering=1 << 16, newline="")
+            self.writer = csv.writer(self.file)
+            if self.header and os.fstat(self.file.fileno()).st_size == 0:
+                self.writer.writerow(self.header)
+        return self.file
+    
+    def write(self, text: str):
+        with self.lock:
+            f = self._handle()
+            f.write(text)
+            f.flush()
+    
+    def writerow(self, row: List[Any]):
+        with self.lock:
+            f = self._handle()
+            self.writer.writerow(row)
+            f.flush()
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+alert_log = AppendFile(ALERT_LOG_FILE)
+costs_csv = AppendFile(COSTS_CSV_FILE, header=["timestamp", "environment", "db_queries", "api_requests", "db_cost", "api_cost", "total_cost"])
+atexit.register(alert_log.close)
+atexit.register(costs_csv.close)
 
 # Cost tracking functions
 def calculate_hourly_costs():
@@ -286,67 +581,94 @@ def calculate_hourly_costs():
     }
     
     # Write to CSV
-    file_exists = os.path.exists("costs.csv")
-    with open("costs.csv", "a", newline="") as csvfile:
-        fieldnames = ["timestamp", "environment", "db_queries", "api_requests", "db_cost", "api_cost", "total_cost"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(cost_data)
+    costs_csv.writerow(list(cost_data.values()))
     
     logger.info(f"Hourly cost logged: ${total_cost:.6f}")
     return cost_data
 
+# Process memory sampling
+_PROCESS = psutil.Process()
+_memory_sample = (float("-inf"), 0.0)  # (monotonic timestamp, memory MB)
+
+def get_memory_mb(max_age: float = 1.0) -> float:
+    """Process RSS in MB, re-sampled at most once per max_age seconds"""
+    global _memory_sample
+    sampled_at, memory_mb = _memory_sample
+    now = time.monotonic()
+    if now - sampled_at >= max_age:
+        memory_mb = _PROCESS.memory_info().rss / 1024 / 1024
+        _memory_sample = (now, memory_mb)
+    return memory_mb
+
 # Alert system
+# Alerts currently on; a condition that persists is logged once when it turns
+# on and once when it clears, not on every check
+_active_alerts = set()
+
 def check_alerts():
-    """Check alert conditions and log to alert.log"""
-    alerts = []
+    """Check alert conditions and log changes to alert.log"""
+    alerts = {}  # kind -> message
     
     # Check response time
     if len(metrics.response_times) >= 3:
         recent_times = list(metrics.response_times)[-3:]
-        if all(t > ALERT_RESPONSE_TIME_MS for t in recent_times):
-            alerts.append(f"High response time: {recent_times} ms (threshold: {ALERT_RESPONSE_TIME_MS}ms)")
+        if all(t > ALERT_RESPONSE_TIME_MS * 1_000_000 for t in recent_times):
+            recent_ms = [round(t / 1_000_000, 2) for t in recent_times]
+            alerts["High response time"] = f"{recent_ms} ms (threshold: {ALERT_RESPONSE_TIME_MS}ms)"
     
     # Check cache hit rate
     cache_hit_rate = metrics.get_cache_hit_rate()
     if cache_hit_rate < ALERT_CACHE_HIT_RATE and (metrics.cache_hits + metrics.cache_misses) > 10:
-        alerts.append(f"Low cache hit rate: {cache_hit_rate:.2%} (threshold: {ALERT_CACHE_HIT_RATE:.0%})")
+        alerts["Low cache hit rate"] = f"{cache_hit_rate:.2%} (threshold: {ALERT_CACHE_HIT_RATE:.0%})"
     
-    # Check memory usage
-    memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
+    # Check memory usage (fresh sample)
+    memory_mb = get_memory_mb(max_age=0)
     if memory_mb > ALERT_MEMORY_MB:
-        alerts.append(f"High memory usage: {memory_mb:.1f}MB (threshold: {ALERT_MEMORY_MB}MB)")
-    
-    # Log alerts
-    if alerts:
-        with open("alert.log", "a") as f:
-            for alert in alerts:
-                f.write(f"{datetime.now().isoformat()} - ALERT: {alert}\n")
-        logger.warning(f"Alerts triggered: {len(alerts)}")
+        alerts["High memory usage"] = f"{memory_mb:.1f}MB (threshold: {ALERT_MEMORY_MB}MB)"
+    
+    # Log only alerts that turned on or off since the last check
+    raised = [kind for kind in alerts if kind not in _active_alerts]
+    resolved = [kind for kind in _active_alerts if kind not in alerts]
+    _active_alerts.difference_update(resolved)
+    _active_alerts.update(raised)
+    if raised or resolved:
+        timestamp = datetime.now().isoformat()
+        alert_log.write(
+            "".join(f"{timestamp} - ALERT: {kind}: {alerts[kind]}\n" for kind in raised)
+            + "".join(f"{timestamp} - RESOLVED: {kind}\n" for kind in resolved)
+        )
+    if raised:
+        logger.warning(f"Alerts triggered: {len(raised)}")
+
+async def alert_monitor():
+    """Check alert conditions periodically, off the request path"""
+    while True:
+        await asyncio.sleep(ALERT_CHECK_INTERVAL)
+        try:
+            # psutil and the log write block, so keep them off the event loop
+            await asyncio.to_thread(check_alerts)
+        except Exception as e:
+            logger.error(f"Alert check error: {e}")
 
 # Middleware for monitoring
 @app.middleware("http")
 async def monitoring_middleware(request: Request, call_next):
     """Monitor requests and track performance metrics"""
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
     
     # Process request
     response = await call_next(request)
     
-    # Calculate response time
-    response_time_ms = (time.time() - start_time) * 1000
+    # Calculate response time (monotonic, integer nanoseconds)
+    response_time_ns = time.perf_counter_ns() - start_ns
     
     # Record metrics
-    metrics.record_request(response_time_ms)
-    
-    # Check alerts
-    check_alerts()
+    metrics.record_request(response_time_ns)
     
     # Add performance headers
+    response_time_ms = response_time_ns / 1_000_000
     response.headers["X-Response-Time"] = f"{response_time_ms:.2f}ms"
+    response.headers["Server-Timing"] = f"app;dur={response_time_ms:.3f}"
     response.headers["X-Environment"] = ENVIRONMENT
     
     return response
@@ -384,31 +706,32 @@ async def root():
 async def create_student(student: Student):
     """Create a new student"""
     conn = get_db_connection()
-    cursor = conn.cursor()
     
     try:
-        cursor.execute("""
-            INSERT INTO students (student_id, name, email, grade_level)
-            VALUES (?, ?, ?, ?)
-        """, (student.student_id, student.name, student.email, student.grade_level))
-        
-        conn.commit()
-        
-        # Cache the student
-        student_cache.put(f"student:{student.student_id}", student.dict())
-        
-        return {"message": "Student created successfully", "student_id": student.student_id}
-    
+        with transaction(conn):
+            conn.execute("""
+                INSERT INTO students (student_id, name, email, grade_level)
+                VALUES (?, ?, ?, ?)
+            """, (student.student_id, student.name, student.email, student.grade_level))
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Student ID or email already exists")
-    finally:
-        conn.close()
+    
+    # Cache the student; it is no longer missing
+    missing_students.delete(student.student_id)
+    student_cache.put(f"student:{student.student_id}", student.model_dump(mode="json"))
+    
+    return {"message": "Student created successfully", "student_id": student.student_id}
 
 @app.get("/students/{student_id}")
 async def get_student(student_id: str):
     """Get student by ID (with caching)"""
     cache_key = f"student:{student_id}"
     
+    # Recently confirmed missing: answered from cache, skipping the database
+    if missing_students.get(student_id):
+        metrics.record_cache_hit()
+        raise HTTPException(status_code=404, detail="Student not found")
+    
     # Try cache first
     cached_student = student_cache.get(cache_key)
     if cached_student:
@@ -416,26 +739,18 @@ async def get_student(student_id: str):
     
     # Query database
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    cursor.execute("""
+    student_data = conn.execute("""
         SELECT student_id, name, email, grade_level, created_at
         FROM students WHERE student_id = ?
-    """, (student_id,))
-    
-    student_data = cursor.fetchone()
-    conn.close()
+    """, (student_id,)).fetchone()
     
     if not student_data:
+        # Remember the miss briefly so repeated lookups skip the database
+        missing_students.put(student_id, True, ttl=NEGATIVE_CACHE_TTL)
         raise HTTPException(status_code=404, detail="Student not found")
     
-    student_dict = {
-        "student_id": student_data[0],
-        "name": student_data[1],
-        "email": student_data[2],
-        "grade_level": student_data[3],
-        "created_at": student_data[4]
-    }
+    student_dict = dict(student_data)
     
     # Cache the result
     student_cache.put(cache_key, student_dict)
@@ -443,94 +758,104 @@ async def get_student(student_id: str):
     return student_dict
 
 @app.get("/students")
-async def get_all_students(limit: int = 50):
-    """Get all students with pagination"""
+async def get_all_students(limit: int = 50, after_name: Optional[str] = None, after_id: Optional[str] = None):
+    """Get all students with keyset pagination (pass the last name/student_id seen)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT student_id, name, email, grade_level, created_at
-        FROM students
-        ORDER BY name
-        LIMIT ?
-    """, (limit,))
-    
-    students = []
-    for row in cursor.fetchall():
-        students.append({
-            "student_id": row[0],
-            "name": row[1],
-            "email": row[2],
-            "grade_level": row[3],
-            "created_at": row[4]
-        })
-    
-    conn.close()
-    return students
+    if after_name is not None:
+        rows = conn.execute(STMT_GET_STUDENTS_AFTER, (after_name, after_id or "", limit))
+    else:
+        rows = conn.execute(STMT_GET_STUDENTS, (limit,))
+    
+    return [dict(row) for row in rows]
 
 # Grade management endpoints
 @app.post("/grades")
 async def add_grade(grade: Grade):
     """Add a single grade"""
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    # Verify student exists
-    cursor.execute("SELECT id FROM students WHERE student_id = ?", (grade.student_id,))
-    if not cursor.fetchone():
-        conn.close()
+    # Add grade; inserts nothing when the student does not exist. Undated
+    # grades take the column's CURRENT_TIMESTAMP default, as in batch inserts
+    with transaction(conn):
+        if grade.date_recorded is None:
+            cursor = conn.execute(INSERT_GRADE_DEFAULT_DATE_IF_STUDENT_SQL,
+                                  (grade.student_id, grade.subject, grade.score, grade.max_score,
+                                   grade.student_id))
+        else:
+            cursor = conn.execute(INSERT_GRADE_IF_STUDENT_SQL,
+                                  (grade.student_id, grade.subject, grade.score, grade.max_score,
+                                   grade.date_recorded, grade.student_id))
+    
+    if cursor.rowcount == 0:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Add grade
-    date_recorded = grade.date_recorded or datetime.now()
-    cursor.execute("""
-        INSERT INTO grades (student_id, subject, score, max_score, date_recorded)
-        VALUES (?, ?, ?, ?, ?)
-    """, (grade.student_id, grade.subject, grade.score, grade.max_score, date_recorded))
-    
-    conn.commit()
     grade_id = cursor.lastrowid
-    conn.close()
     
     # Invalidate cache for this student
-    student_cache.cache.pop(f"analytics:{grade.student_id}", None)
+    student_cache.delete(f"analytics:{grade.student_id}")
     
     return {"message": "Grade added successfully", "grade_id": grade_id}
 
-@app.post("/grades/batch")
-async def add_grades_batch(grades: List[Grade], background_tasks: BackgroundTasks):
+# The batch endpoint reads its raw body, so its schema is declared by hand;
+# Grade itself is already a component through POST /grades
+_GRADE_LIST_SCHEMA = GradeListAdapter.json_schema(ref_template="#/components/schemas/{model}")
+_GRADE_LIST_SCHEMA.pop("$defs", None)
+
+@app.post("/grades/batch", openapi_extra={
+    "requestBody": {"required": True, "content": {"application/json": {"schema": _GRADE_LIST_SCHEMA}}}
+})
+async def add_grades_batch(request: Request, background_tasks: BackgroundTasks):
     """Add multiple grades in batch (background processing)"""
+    # Validate the raw body in one pass instead of model-by-model
+    try:
+        grades = GradeListAdapter.validate_json(await request.body())
+    except ValidationError as e:
+        # Same error locations FastAPI reports for a declared body parameter
+        raise RequestValidationError([
+            {**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)
+        ])
     
     def process_batch():
         conn = get_db_connection()
         cursor = conn.cursor()
         
         try:
-            # Batch insert for performance
-            grade_data = []
-            for grade in grades:
-                date_recorded = grade.date_recorded or datetime.now()
-                grade_data.append((
-                    grade.student_id, grade.subject, grade.score, 
-                    grade.max_score, date_recorded
-                ))
+            # Batch insert for performance; rows without a date take the
+            # column's CURRENT_TIMESTAMP default instead of a Python datetime
+            undated = [
+                (grade.student_id, grade.subject, grade.score, grade.max_score)
+                for grade in grades if grade.date_recorded is None
+            ]
+            dated = [
+                (grade.student_id, grade.subject, grade.score,
+                 grade.max_score, grade.date_recorded)
+                for grade in grades if grade.date_recorded is not None
+            ]
+            reindex = len(grades) > BATCH_REINDEX_THRESHOLD
             
-            cursor.executemany("""
-                INSERT INTO grades (student_id, subject, score, max_score, date_recorded)
-                VALUES (?, ?, ?, ?, ?)
-            """, grade_data)
+            # One transaction for the whole batch instead of one per row
+            with transaction(conn):
+                if reindex:
+                    # Bulk load without index maintenance, then rebuild once
+                    for name in GRADE_INDEX_NAMES:
+                        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+                if undated:
+                    cursor.executemany(INSERT_GRADE_DEFAULT_DATE_SQL, undated)
+                if dated:
+                    cursor.executemany(INSERT_GRADE_SQL, dated)
+                if reindex:
+                    for statement in GRADE_INDEXES:
+                        cursor.execute(statement)
             
-            conn.commit()
             logger.info(f"Batch processed: {len(grades)} grades added")
             
             # Clear relevant cache entries
             for grade in grades:
-                student_cache.cache.pop(f"analytics:{grade.student_id}", None)
+                student_cache.delete(f"analytics:{grade.student_id}")
         
         except Exception as e:
             logger.error(f"Batch processing error: {e}")
-        finally:
-            conn.close()
     
     background_tasks.add_task(process_batch)
     
@@ -548,61 +873,55 @@ async def get_student_analytics(student_id: str):
     # Try cache first
     cached_analytics = student_cache.get(cache_key)
     if cached_analytics:
-        return cached_analytics
+        return Response(content=cached_analytics, media_type="application/json")
     
     conn = get_db_connection()
-    cursor = conn.cursor()
     
     # Get student info
-    cursor.execute("SELECT name FROM students WHERE student_id = ?", (student_id,))
-    student_data = cursor.fetchone()
+    student_data = conn.execute("SELECT name FROM students WHERE student_id = ?", (student_id,)).fetchone()
     
     if not student_data:
-        conn.close()
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Get grade analytics
-    cursor.execute("""
-        SELECT score, subject
+    # Aggregate grades inside SQLite instead of pulling every row
+    stats = conn.execute("""
+        SELECT COUNT(*) AS total_grades, AVG(score) AS average_score,
+               MAX(score) AS highest_score, MIN(score) AS lowest_score
         FROM grades
         WHERE student_id = ?
-        ORDER BY date_recorded DESC
-    """, (student_id,))
+    """, (student_id,)).fetchone()
     
-    grades_data = cursor.fetchall()
-    conn.close()
-    
-    if not grades_data:
+    if not stats["total_grades"]:
         raise HTTPException(status_code=404, detail="No grades found for student")
     
-    # Calculate analytics
-    scores = [row[0] for row in grades_data]
-    subjects = list(set(row[1] for row in grades_data))
+    # Subjects as separate rows; subject names may contain any separator
+    subjects = [row[0] for row in conn.execute(
+        "SELECT DISTINCT subject FROM grades WHERE student_id = ? ORDER BY subject", (student_id,)
+    )]
     
     analytics = StudentAnalytics(
         student_id=student_id,
-        student_name=student_data[0],
-        total_grades=len(scores),
-        average_score=round(mean(scores), 2),
-        highest_score=max(scores),
-        lowest_score=min(scores),
+        student_name=student_data["name"],
+        total_grades=stats["total_grades"],
+        average_score=round(stats["average_score"], 2),
+        highest_score=stats["highest_score"],
+        lowest_score=stats["lowest_score"],
         subjects=subjects
     )
     
-    # Cache the result
-    student_cache.put(cache_key, analytics.dict())
+    # Cache the serialized result so cache hits skip re-encoding
+    body = orjson.dumps(analytics.model_dump(mode="json"))
+    student_cache.put(cache_key, body)
     
-    return analytics
+    return Response(content=body, media_type="application/json")
 
 @app.get("/analytics/class")
 async def get_class_analytics(grade_level: Optional[int] = None, subject: Optional[str] = None):
     """Get class-wide analytics with optional filtering"""
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    # Build query based on filters
-    query = """
-        SELECT g.score, g.subject, s.grade_level, s.name
+    # Build filter based on query parameters
+    from_clause = """
         FROM grades g
         JOIN students s ON g.student_id = s.student_id
         WHERE 1=1
@@ -610,31 +929,46 @@ async def get_class_analytics(grade_level: Optional[int] = None, subject: Option
     params = []
     
     if grade_level:
-        query += " AND s.grade_level = ?"
+        from_clause += " AND s.grade_level = ?"
         params.append(grade_level)
     
     if subject:
-        query += " AND g.subject = ?"
+        from_clause += " AND g.subject = ?"
         params.append(subject)
     
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    conn.close()
+    # Aggregate in SQL
+    total_grades, average_score, highest_score, lowest_score = conn.execute(f"""
+        SELECT COUNT(*), AVG(g.score), MAX(g.score), MIN(g.score)
+        {from_clause}
+    """, params).fetchone()
     
-    if not results:
+    if not total_grades:
         return {"message": "No data found for the specified criteria"}
     
-    # Calculate class analytics
-    scores = [row[0] for row in results]
-    subjects = list(set(row[1] for row in results))
-    grade_levels = list(set(row[2] for row in results))
+    # Distinct values as rows rather than a delimited string, so subject
+    # names may contain any character
+    subjects = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT g.subject {from_clause} ORDER BY g.subject", params
+    )]
+    grade_levels = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT s.grade_level {from_clause} ORDER BY s.grade_level", params
+    )]
+    
+    # Median: average of the middle one or two scores
+    median_score = conn.execute(f"""
+        SELECT AVG(score) FROM (
+            SELECT g.score AS score {from_clause}
+            ORDER BY g.score
+            LIMIT ? OFFSET ?
+        )
+    """, params + [2 - total_grades % 2, (total_grades - 1) // 2]).fetchone()[0]
     
     return {
-        "total_grades": len(scores),
-        "average_score": round(mean(scores), 2),
-        "median_score": round(median(scores), 2),
-        "highest_score": max(scores),
-        "lowest_score": min(scores),
+        "total_grades": total_grades,
+        "average_score": round(average_score, 2),
+        "median_score": round(median_score, 2),
+        "highest_score": highest_score,
+        "lowest_score": lowest_score,
         "subjects": subjects,
         "grade_levels": grade_levels,
         "filters_applied": {
@@ -643,18 +977,8 @@ async def get_class_analytics(grade_level: Optional[int] = None, subject: Option
         }
     }
 
-# Monitoring dashboard
-@app.get("/dashboard", response_class=HTMLResponse)
-async def monitoring_dashboard():
-    """Real-time monitoring dashboard"""
-    
-    # Get current metrics
-    memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
-    cache_hit_rate = metrics.get_cache_hit_rate()
-    avg_response_time = metrics.get_avg_response_time()
-    requests_per_min = metrics.get_requests_per_minute()
-    
-    html_content = f"""
+# Monitoring dashboard template; placeholders are filled with str.format_map
+DASHBOARD_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -678,8 +1002,8 @@ async def monitoring_dashboard():
         <div class="container">
             <div class="header">
                 <h1>📊 Student Grade Analytics - Monitoring Dashboard</h1>
-                <p>Environment: <span class="environment">{ENVIRONMENT.upper()}</span> | 
-                   Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+                <p>Environment: <span class="environment">{environment}</span> | 
+                   Last Updated: {last_updated}</p>
             </div>
             
             <div class="metrics">
@@ -689,39 +1013,39 @@ async def monitoring_dashboard():
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value {'status-good' if cache_hit_rate >= 0.7 else 'status-warning'}">{cache_hit_rate:.1%}</div>
+                    <div class="metric-value {cache_status}">{cache_hit_rate:.1%}</div>
                     <div class="metric-label">Cache Hit Rate</div>
-                    <small>Hits: {metrics.cache_hits} | Misses: {metrics.cache_misses}</small>
+                    <small>Hits: {cache_hits} | Misses: {cache_misses}</small>
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value {'status-good' if avg_response_time < 300 else 'status-warning'}">{avg_response_time:.1f}ms</div>
+                    <div class="metric-value {response_status}">{avg_response_time:.1f}ms</div>
                     <div class="metric-label">Average Response Time</div>
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value {'status-good' if memory_mb < 500 else 'status-warning'}">{memory_mb:.1f}MB</div>
+                    <div class="metric-value {memory_status}">{memory_mb:.1f}MB</div>
                     <div class="metric-label">Memory Usage</div>
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value">{metrics.db_query_count}</div>
+                    <div class="metric-value">{db_query_count}</div>
                     <div class="metric-label">Database Queries</div>
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value">{metrics.request_count}</div>
+                    <div class="metric-value">{request_count}</div>
                     <div class="metric-label">Total API Requests</div>
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value">{student_cache.size()}</div>
+                    <div class="metric-value">{cache_size}</div>
                     <div class="metric-label">Cache Size</div>
-                    <small>Capacity: {CACHE_SIZE}</small>
+                    <small>Capacity: {cache_capacity}</small>
                 </div>
                 
                 <div class="metric-card">
-                    <div class="metric-value">${(metrics.db_query_count * COST_PER_DB_QUERY + (metrics.request_count / 100) * COST_PER_100_API_CALLS):.4f}</div>
+                    <div class="metric-value">${session_cost:.4f}</div>
                     <div class="metric-label">Current Session Cost</div>
                 </div>
             </div>
@@ -729,28 +1053,79 @@ async def monitoring_dashboard():
             <div style="margin-top: 30px; background: white; padding: 20px; border-radius: 8px;">
                 <h3>🚨 Alert Thresholds</h3>
                 <ul>
-                    <li>Response Time: > {ALERT_RESPONSE_TIME_MS}ms for 3 consecutive requests</li>
-                    <li>Cache Hit Rate: < {ALERT_CACHE_HIT_RATE:.0%}</li>
-                    <li>Memory Usage: > {ALERT_MEMORY_MB}MB</li>
+                    <li>Response Time: > {alert_response_time_ms}ms for 3 consecutive requests</li>
+                    <li>Cache Hit Rate: < {alert_cache_hit_rate:.0%}</li>
+                    <li>Memory Usage: > {alert_memory_mb}MB</li>
                 </ul>
                 
                 <h3>💰 Cost Configuration</h3>
                 <ul>
-                    <li>Database Query: ${COST_PER_DB_QUERY} each</li>
-                    <li>API Calls: ${COST_PER_100_API_CALLS} per 100 requests</li>
+                    <li>Database Query: ${cost_per_db_query} each</li>
+                    <li>API Calls: ${cost_per_100_api_calls} per 100 requests</li>
                 </ul>
             </div>
         </div>
     </body>
     </html>
     """
+
+# Values that do not change while the process runs
+DASHBOARD_STATIC = {
+    "environment": ENVIRONMENT.upper(),
+    "cache_capacity": CACHE_SIZE,
+    "alert_response_time_ms": ALERT_RESPONSE_TIME_MS,
+    "alert_cache_hit_rate": ALERT_CACHE_HIT_RATE,
+    "alert_memory_mb": ALERT_MEMORY_MB,
+    "cost_per_db_query": COST_PER_DB_QUERY,
+    "cost_per_100_api_calls": COST_PER_100_API_CALLS,
+}
+
+# Last rendered dashboard: (monotonic second, html)
+_dashboard_cache = (None, "")
+
+@app.get("/dashboard", response_class=HTMLResponse)
+async def monitoring_dashboard():
+    """Real-time monitoring dashboard"""
+    global _dashboard_cache
+    
+    # Serve the page rendered earlier in the same second (up to 1s stale);
+    # the counters change on every request, so they cannot be part of the key
+    second = int(time.monotonic())
+    cached_second, html_content = _dashboard_cache
+    if cached_second == second:
+        return html_content
+    
+    # Get current metrics
+    memory_mb = get_memory_mb()
+    cache_hit_rate = metrics.get_cache_hit_rate()
+    avg_response_time = metrics.get_avg_response_time()
+    requests_per_min = metrics.get_requests_per_minute()
+    
+    html_content = DASHBOARD_TEMPLATE.format_map({
+        **DASHBOARD_STATIC,
+        "last_updated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "requests_per_min": requests_per_min,
+        "cache_status": 'status-good' if cache_hit_rate >= 0.7 else 'status-warning',
+        "cache_hit_rate": cache_hit_rate,
+        "cache_hits": metrics.cache_hits,
+        "cache_misses": metrics.cache_misses,
+        "response_status": 'status-good' if avg_response_time < 300 else 'status-warning',
+        "avg_response_time": avg_response_time,
+        "memory_status": 'status-good' if memory_mb < 500 else 'status-warning',
+        "memory_mb": memory_mb,
+        "db_query_count": metrics.db_query_count,
+        "request_count": metrics.request_count,
+        "cache_size": student_cache.size(),
+        "session_cost": metrics.db_query_count * COST_PER_DB_QUERY + (metrics.request_count / 100) * COST_PER_100_API_CALLS,
+    })
+    _dashboard_cache = (second, html_content)
     
     return html_content
 
 @app.get("/metrics")
 async def get_metrics():
     """Get current system metrics (JSON)"""
-    memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
+    memory_mb = get_memory_mb()
     
     return {
         "timestamp": datetime.now().isoformat(),
@@ -809,17 +1184,17 @@ async def get_current_costs():
 @app.post("/costs/hourly-summary")
 async def generate_hourly_cost_summary():
     """Generate and save hourly cost summary"""
-    cost_data = calculate_hourly_costs()
+    cost_data = await asyncio.to_thread(calculate_hourly_costs)
     return {
         "message": "Hourly cost summary generated",
         "cost_data": cost_data,
-        "csv_file": "costs.csv"
+        "csv_file": COSTS_CSV_FILE
     }
 
 @app.get("/health")
 async def health_check():
     """Comprehensive health check"""
-    memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
+    memory_mb = get_memory_mb()
     
     # Determine health status
     status = "healthy"